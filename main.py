@@ -1,7 +1,10 @@
 import streamlit as st
 from google import genai
 import time
-from datetime import datetime
+import threading
+from collections import deque
+from typing import Final
+from concurrent.futures import ThreadPoolExecutor
 
 import os
 from dotenv import load_dotenv
@@ -41,21 +44,8 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# HS 데이터 매니저 초기화 (캐싱을 통해 성능 최적화)
-@st.cache_resource
-def get_hs_manager():
-    return HSDataManager()
-
-# 세션 상태 초기화
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []  # 채팅 기록 저장
-
-if 'selected_category' not in st.session_state:
-    st.session_state.selected_category = "AI자동분류"  # 기본값
-
-if 'context' not in st.session_state:
-    # 초기 컨텍스트 설정
-    st.session_state.context = """당신은 HS 품목분류 전문가로서 관세청에서 오랜 경력을 가진 전문가입니다. 사용자가 물어보는 품목에 대해 아래 네 가지 유형 중 하나로 질문을 분류하여 답변해주세요.
+# 기본 시스템 프롬프트 (대화 컨텍스트의 고정 머리말, 세션/턴마다 복사하지 않는 단일 상수)
+SYSTEM_PROMPT: Final[str] = """당신은 HS 품목분류 전문가로서 관세청에서 오랜 경력을 가진 전문가입니다. 사용자가 물어보는 품목에 대해 아래 네 가지 유형 중 하나로 질문을 분류하여 답변해주세요.
 
 질문 유형:
 1. 웹 검색(Web Search): 물품개요, 용도, 기술개발, 무역동향 등 일반 정보 탐색이 필요한 경우.
@@ -73,46 +63,139 @@ if 'context' not in st.session_state:
 지금까지의 대화:
 """
 
+# LLM 프롬프트에 포함할 최근 대화 턴 수
+MAX_HISTORY_TURNS: Final[int] = 10
+
+# 채팅 화면에 한 번에 표시할 최근 메시지 수 (이전 메시지는 버튼으로 추가 로드)
+CHAT_PAGE_SIZE: Final[int] = 50
+
+# 질문 유형 라디오 버튼 라벨 → 실제 카테고리명
+CATEGORY_LABELS: Final[dict] = {
+    "AI자동분류 (AI가 질문 유형을 자동 판별)": "AI자동분류",
+    "웹검색 (물품개요, 시장동향, 뉴스, 산업현황 검색)": "웹검색",
+    "국내HS분류사례 검색 (관세청 분류사례 기반 HS코드 추천)": "국내HS분류사례 검색",
+    "해외HS분류사례검색 (미국/EU 분류사례 비교분석)": "해외HS분류사례검색",
+    "HS해설서분석 (사용자 제시 HS코드들을 비교분석하여 최적 코드 추천)": "HS해설서분석",
+    "HS해설서원문검색 (특정 HS코드의 해설서 원문 조회)": "HS해설서원문검색"
+}
+
+def get_selected_category():
+    """라디오 위젯 상태(category_radio)에서 현재 선택된 카테고리명 조회"""
+    return CATEGORY_LABELS.get(st.session_state.get("category_radio"), "AI자동분류")
+
+def build_context():
+    """시스템 프롬프트와 최근 대화 기록을 합쳐 LLM에 전달할 컨텍스트 생성"""
+    return SYSTEM_PROMPT + "\n".join(
+        f"사용자: {user}\n품목분류 전문가: {assistant}" for user, assistant in st.session_state.history
+    )
+
+# HS 데이터 매니저 초기화 (캐싱을 통해 성능 최적화)
+@st.cache_resource
+def get_hs_manager():
+    return HSDataManager()
+
+@st.cache_resource
+def start_hs_manager_prewarm():
+    """프로세스당 한 번, 백그라운드 스레드에서 HSDataManager 로드 시작 (첫 질문 시 로딩 대기 제거)"""
+    # cache_resource는 키별로 잠금을 사용하므로 로딩 중 UI 스레드의 호출은 같은 인스턴스를 기다림
+    thread = threading.Thread(target=get_hs_manager, name="hs-manager-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+start_hs_manager_prewarm()
+
+# 세션 상태 초기화
+if 'chat_history' not in st.session_state:
+    st.session_state.chat_history = []  # 채팅 기록 저장
+
+if 'chat_display_limit' not in st.session_state:
+    st.session_state.chat_display_limit = CHAT_PAGE_SIZE  # 화면에 표시할 최근 메시지 수
+
+if 'history' not in st.session_state:
+    # 최근 대화 턴 (사용자 질문, 전문가 답변) 저장 - 오래된 턴은 자동으로 제거
+    st.session_state.history = deque(maxlen=MAX_HISTORY_TURNS)
+
 if 'ai_analysis_results' not in st.session_state:
     st.session_state.ai_analysis_results = []
 
+# 로그 레벨별 아이콘
+LOG_ICONS: Final[dict] = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "DATA": "📊", "AI": "🤖", "SEARCH": "🔍"}
+
 class RealTimeProcessLogger:
     def __init__(self, container):
         self.container = container
         self.log_placeholder = container.empty()
-        self.logs = []
-        self.start_time = time.time()
+        self.log_text = []  # 표시용으로 미리 포맷된 로그 라인
+        self.start_ns = time.monotonic_ns()  # 경과 시간 기준점 (단조 시계)
     
     def log_actual(self, level, message, data=None):
-        """실제 진행 상황만 기록"""
-        elapsed = time.time() - self.start_time
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        """실제 진행 상황만 기록 (포맷은 기록 시점에 한 번만 수행, 경과 시간만 표시)"""
+        elapsed_ns = time.monotonic_ns() - self.start_ns
         
-        log_entry = {
-            "time": timestamp,
-            "elapsed": f"{elapsed:.2f}s",
-            "level": level,
-            "message": message,
-            "data": data
-        }
-        self.logs.append(log_entry)
+        icon = LOG_ICONS.get(level, "📝")
+        data_str = f" | {data}" if data else ""
+        self.log_text.append(f"`+{elapsed_ns / 1e9:.2f}s` {icon} {message}{data_str}\n\n")
         self.update_display()
     
     def update_display(self):
-        log_text = ""
-        icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "DATA": "📊", "AI": "🤖", "SEARCH": "🔍"}
-        
-        for log in self.logs[-8:]:
-            icon = icons.get(log['level'], "📝")
-            data_str = f" | {log['data']}" if log['data'] else ""
-            log_text += f"`{log['time']}` `+{log['elapsed']}` {icon} {log['message']}{data_str}\n\n"
-        
-        self.log_placeholder.markdown(log_text)
+        self.log_placeholder.markdown("".join(self.log_text[-8:]))
     
     def clear(self):
-        self.logs = []
+        self.log_text = []
         self.log_placeholder.empty()
 
+class DeferredProcessLogger:
+    """작업 스레드용 로거 (기록만 모아 두었다가 Streamlit 스크립트 스레드에서 실제 로거로 출력)"""
+    def __init__(self):
+        self.records = []
+    
+    def log_actual(self, level, message, data=None):
+        self.records.append((level, message, data))
+    
+    def flush_to(self, logger):
+        for level, message, data in self.records:
+            logger.log_actual(level, message, data)
+
+
+def render_answer_stream(chunks, header=""):
+    """Gemini 스트리밍 응답 조각을 받아 화면에 점진적으로 표시하고, 정제된 전체 답변을 반환"""
+    placeholder = st.empty()
+    answer_parts = []
+    for chunk in chunks:
+        answer_parts.append(chunk)
+        placeholder.markdown(header + "".join(answer_parts))
+    # 완성된 답변은 채팅 영역에 추가되므로 스트리밍 표시는 제거
+    placeholder.empty()
+    return header + clean_text("".join(answer_parts))
+
+
+def prefetch_raw_explanations(user_input):
+    """입력에 HS 코드가 있으면 해설서 원문을 미리 조회 (AI자동분류 시 분류 LLM 호출과 동시에 실행)
+    - (원문, 코드별 조회 로그가 담긴 DeferredProcessLogger) 반환, 로그는 스크립트 스레드에서 출력
+    """
+    hs_codes = extract_hs_codes(user_input)
+    if not hs_codes:
+        return None
+    deferred_logger = DeferredProcessLogger()
+    return clean_text(get_hs_explanations(hs_codes, deferred_logger)), deferred_logger
+
+
+# 질문 유형별 답변 처리기: (처리 함수, 답변 머리말 라벨, 로그 레벨)
+# 처리 함수는 (user_input, context, hs_manager, logger)를 받아 답변 조각을 반환하는 제너레이터 (hs_manual_raw는 별도 처리)
+ANSWER_HANDLERS: Final[dict] = {
+    "web_search": (
+        lambda user_input, context, hs_manager, logger: handle_web_search(user_input, context, hs_manager),
+        "웹검색 실시", "SEARCH"),
+    "hs_classification": (
+        # Multi-Agent 분석 실행 (UI 컨테이너 없이)
+        lambda user_input, context, hs_manager, logger: handle_hs_classification_cases(user_input, context, hs_manager, None),
+        "HS 분류사례 검색 실시", "AI"),
+    "overseas_hs": (
+        lambda user_input, context, hs_manager, logger: handle_overseas_hs(user_input, context, hs_manager, None),
+        "해외 HS 분류 검색 실시", "AI"),
+    "hs_manual": (handle_hs_manual_with_parallel_search, "HS 해설서 분석 실시 (병렬 검색)", "AI"),
+}
+
 
 def process_query_with_real_logging(user_input):
     """실제 진행사항을 기록하면서 쿼리 처리"""
@@ -123,19 +206,32 @@ def process_query_with_real_logging(user_input):
     try:
         logger.log_actual("INFO", "Query processing started", f"Input length: {len(user_input)}")
         
-        start_time = time.time()
+        start_time = time.perf_counter()
         hs_manager = get_hs_manager()
-        load_time = time.time() - start_time
+        load_time = time.perf_counter() - start_time
         logger.log_actual("SUCCESS", "HSDataManager loaded", f"{load_time:.2f}s")
         
-        category = st.session_state.selected_category
+        category = get_selected_category()
         logger.log_actual("INFO", "Category selected", category)
         
+        raw_future = None
         if category == "AI자동분류":
             logger.log_actual("AI", "Starting LLM question classification...")
-            start_classify = time.time()
-            q_type = classify_question(user_input)
-            classify_time = time.time() - start_classify
+            start_classify = time.perf_counter()
+            # 분류 LLM 호출을 기다리는 동안 로컬 해설서 원문 조회를 미리 실행 (hs_manual_raw로 분류될 때만 사용)
+            executor = ThreadPoolExecutor(max_workers=2)
+            try:
+                classify_future = executor.submit(classify_question, user_input)
+                raw_future = executor.submit(prefetch_raw_explanations, user_input)
+                q_type = classify_future.result()
+            finally:
+                # 대기 중인 작업은 취소하지 않음 (분류가 캐시 적중으로 즉시 끝나도 원문 조회는 계속 진행)
+                executor.shutdown(wait=False)
+            if q_type != "hs_manual_raw":
+                raw_future.cancel()
+                raw_future = None
+                logger.log_actual("INFO", "Speculative raw manual prefetch discarded")
+            classify_time = time.perf_counter() - start_classify
             logger.log_actual("SUCCESS", "LLM classification completed", f"{q_type} in {classify_time:.2f}s")
         else:
             category_mapping = {
@@ -148,31 +244,16 @@ def process_query_with_real_logging(user_input):
             q_type = category_mapping.get(category, "hs_classification")
             logger.log_actual("INFO", "Question type mapped", q_type)
 
-        answer_start = time.time()
+        context = build_context()
+        answer_start = time.perf_counter()
         
-        if q_type == "web_search":
-            logger.log_actual("SEARCH", "Initiating Google Search API call...")
-            ai_start = time.time()
-            answer = "\n\n +++ 웹검색 실시 +++\n\n" + handle_web_search(user_input, st.session_state.context, hs_manager)
-            ai_time = time.time() - ai_start
-            logger.log_actual("SUCCESS", "Web search completed", f"{ai_time:.2f}s, {len(answer)} chars")
-            
-        elif q_type == "hs_classification":
-            # Multi-Agent 분석 실행 (UI 컨테이너 없이)
-            final_answer = handle_hs_classification_cases(user_input, st.session_state.context, hs_manager, None)
-            answer = "\n\n +++ HS 분류사례 검색 실시 +++\n\n" + final_answer
-            
-        elif q_type == "overseas_hs":
-            # Multi-Agent 분석 실행 (UI 컨테이너 없이)
-            final_answer = handle_overseas_hs(user_input, st.session_state.context, hs_manager, None)
-            answer = "\n\n +++ 해외 HS 분류 검색 실시 +++\n\n" + final_answer
-            
-        elif q_type == "hs_manual":
-            logger.log_actual("AI", "Starting enhanced parallel HS manual analysis...")
-            ai_start = time.time()
-            answer = "\n\n +++ HS 해설서 분석 실시 (병렬 검색) +++ \n\n" + handle_hs_manual_with_parallel_search(user_input, st.session_state.context, hs_manager, logger)
-            ai_time = time.time() - ai_start
-            logger.log_actual("SUCCESS", "Enhanced HS manual analysis completed", f"{ai_time:.2f}s, {len(answer)} chars")
+        if q_type in ANSWER_HANDLERS:
+            handler, label, level = ANSWER_HANDLERS[q_type]
+            logger.log_actual(level, f"Starting {label}...")
+            ai_start = time.perf_counter()
+            answer = render_answer_stream(handler(user_input, context, hs_manager, logger), f"\n\n +++ {label} +++\n\n")
+            ai_time = time.perf_counter() - ai_start
+            logger.log_actual("SUCCESS", f"{label} completed", f"{ai_time:.2f}s, {len(answer)} chars")
             
         elif q_type == "hs_manual_raw":
             logger.log_actual("SEARCH", "Extracting HS codes...")
@@ -180,19 +261,31 @@ def process_query_with_real_logging(user_input):
             if hs_codes:
                 logger.log_actual("SUCCESS", f"Found {len(hs_codes)} HS codes", ", ".join(hs_codes))
                 logger.log_actual("DATA", "Retrieving raw HS explanations...")
-                raw_start = time.time()
-                raw_answer = clean_text(get_hs_explanations(hs_codes))
-                raw_time = time.time() - raw_start
+                raw_start = time.perf_counter()
+                raw_answer = None
+                if raw_future is not None:
+                    # 분류와 동시에 미리 조회해 둔 결과 사용 (실패 시 직접 조회)
+                    try:
+                        prefetched = raw_future.result()
+                    except Exception as e:
+                        logger.log_actual("ERROR", f"Raw manual prefetch failed: {str(e)}")
+                    else:
+                        if prefetched is not None:
+                            raw_answer, prefetch_logger = prefetched
+                            prefetch_logger.flush_to(logger)
+                if raw_answer is None:
+                    raw_answer = clean_text(get_hs_explanations(hs_codes, logger))
+                raw_time = time.perf_counter() - raw_start
                 answer = "\n\n +++ HS 해설서 원문 검색 실시 +++ \n\n" + raw_answer
                 logger.log_actual("SUCCESS", "Raw HS manual retrieved", f"{raw_time:.2f}s, {len(raw_answer)} chars")
             else:
                 logger.log_actual("ERROR", "No valid HS codes found in input")
                 answer = "HS 코드를 찾을 수 없습니다. 4자리 HS 코드를 입력해주세요."
 
-        answer_time = time.time() - answer_start
+        answer_time = time.perf_counter() - answer_start
         logger.log_actual("SUCCESS", "Answer generation completed", f"{answer_time:.2f}s, {len(answer)} chars")
         
-        total_time = time.time() - logger.start_time
+        total_time = (time.monotonic_ns() - logger.start_ns) / 1e9
         logger.log_actual("INFO", "Process completed successfully", f"Total time: {total_time:.2f}s")
         
         # Return the answer for external processing
@@ -249,29 +342,14 @@ with st.sidebar:
     # 새로운 채팅 시작 버튼
     if st.button("새로운 채팅 시작하기", type="primary"):
         st.session_state.chat_history = []  # 채팅 기록 초기화
+        st.session_state.chat_display_limit = CHAT_PAGE_SIZE
         # Multi-Agent 및 HS 해설서 분석 결과도 초기화
         if 'ai_analysis_results' in st.session_state:
             st.session_state.ai_analysis_results = []
         if 'hs_manual_analysis_results' in st.session_state:
             st.session_state.hs_manual_analysis_results = []
-        # 컨텍스트 초기화 (기본 컨텍스트 재사용)
-        st.session_state.context = """당신은 HS 품목분류 전문가로서 관세청에서 오랜 경력을 가진 전문가입니다. 사용자가 물어보는 품목에 대해 아래 네 가지 유형 중 하나로 질문을 분류하여 답변해주세요.
-
-질문 유형:
-1. 웹 검색(Web Search): 물품개요, 용도, 기술개발, 무역동향 등 일반 정보 탐색이 필요한 경우.
-2. HS 분류 검색(HS Classification Search): HS 코드, 품목분류, 관세, 세율 등 HS 코드 관련 정보가 필요한 경우.
-3. HS 해설서 분석(HS Manual Analysis): HS 해설서 본문 심층 분석이 필요한 경우.
-4. 해외 HS 분류(Overseas HS Classification): 해외(미국/EU) HS 분류 사례가 필요한 경우.
-
-중요 지침:
-1. 사용자가 질문하는 물품에 대해 관련어, 유사품목, 대체품목도 함께 고려하여 가장 적합한 HS 코드를 찾아주세요.
-2. 품목의 성분, 용도, 가공상태 등을 고려하여 상세히 설명해주세요.
-3. 사용자가 특정 HS code를 언급하며 질문하는 경우, 답변에 해당 HS code 해설서 분석 내용을 포함하여 답변해주세요.
-4. 관련 규정이나 판례가 있다면 함께 제시해주세요.
-5. 답변은 간결하면서도 전문적으로 제공해주세요.
-
-지금까지의 대화:
-"""
+        # 대화 기록 초기화 (시스템 프롬프트는 상수로 재사용)
+        st.session_state.history.clear()
         st.success("✅ 새로운 채팅이 시작되었습니다!")
 
 # 메인 페이지 설정
@@ -279,32 +357,16 @@ st.title("HS 품목분류 챗봇")
 st.write("HS 품목분류에 대해 질문해주세요!")
 
 # 질문 유형 선택 라디오 버튼
-selected_category = st.radio(
+st.radio(
     "질문 유형을 선택하세요:",
-    [
-        "AI자동분류 (AI가 질문 유형을 자동 판별)",
-        "웹검색 (물품개요, 시장동향, 뉴스, 산업현황 검색)", 
-        "국내HS분류사례 검색 (관세청 분류사례 기반 HS코드 추천)",
-        "해외HS분류사례검색 (미국/EU 분류사례 비교분석)",
-        "HS해설서분석 (사용자 제시 HS코드들을 비교분석하여 최적 코드 추천)",
-        "HS해설서원문검색 (특정 HS코드의 해설서 원문 조회)"
-    ],
+    list(CATEGORY_LABELS),
     index=0,  # 기본값: AI자동분류
     horizontal=False,  # 세로 배열로 변경 (설명이 길어져서)
     key="category_radio"
 )
 
-# 선택된 카테고리에서 실제 카테고리명 추출
-category_mapping = {
-    "AI자동분류 (AI가 질문 유형을 자동 판별)": "AI자동분류",
-    "웹검색 (물품개요, 시장동향, 뉴스, 산업현황 검색)": "웹검색",
-    "국내HS분류사례 검색 (관세청 분류사례 기반 HS코드 추천)": "국내HS분류사례 검색",
-    "해외HS분류사례검색 (미국/EU 분류사례 비교분석)": "해외HS분류사례검색",
-    "HS해설서분석 (사용자 제시 HS코드들을 비교분석하여 최적 코드 추천)": "HS해설서분석",
-    "HS해설서원문검색 (특정 HS코드의 해설서 원문 조회)": "HS해설서원문검색"
-}
-actual_category = category_mapping[selected_category]
-st.session_state.selected_category = actual_category
+# 선택된 카테고리에서 실제 카테고리명 추출 (라디오 위젯 값이 유일한 상태 저장소)
+actual_category = get_selected_category()
 
 # 선택된 유형에 따른 예시 질문 표시
 example_messages = {
@@ -320,15 +382,11 @@ st.info(example_messages[actual_category])
 
 st.divider()  # 구분선 추가
 
-# 채팅 기록 표시
-for message in st.session_state.chat_history:
-    if message["role"] == "user":
-        st.markdown(f"""<div style='background-color: #e6f7ff; padding: 10px; border-radius: 10px; margin-bottom: 10px;'>
-                   <strong>사용자:</strong> {message['content']}
-                   </div>""", unsafe_allow_html=True)
-    else:
-        # 분석 과정이 있는 경우 expander 표시
-        if any(keyword in message['content'] for keyword in ["+++ HS 분류사례 검색 실시 +++", "+++ 해외 HS 분류 검색 실시 +++", "+++ HS 해설서 분석 실시 (병렬 검색) +++", "+++ HS 해설서 분석 실시 (사용자 제시 코드) +++"]):
+def render_message(message):
+    """채팅 메시지 한 건 표시 (Streamlit 기본 채팅 말풍선 사용)"""
+    with st.chat_message(message["role"]):
+        # 분석 과정이 있는 답변은 expander 먼저 표시
+        if message["role"] == "assistant" and any(keyword in message['content'] for keyword in ["+++ HS 분류사례 검색 실시 +++", "+++ 해외 HS 분류 검색 실시 +++", "+++ HS 해설서 분석 실시 (병렬 검색) +++", "+++ HS 해설서 분석 실시 (사용자 제시 코드) +++"]):
             # AI 분석 과정 expander 표시 (채팅 기록에서도 항상 표시)
             with st.expander("🔍 **AI 분석 과정 보기**", expanded=False):
                 if "+++ HS 해설서 분석 실시 (사용자 제시 코드) +++" in message['content']:
@@ -348,14 +406,14 @@ for message in st.session_state.chat_history:
                         # 가장 최근 분석 결과 표시
                         latest_result = st.session_state.hs_manual_analysis_results[-1]
                         search_results = latest_result.get('search_results', [])
-                        
+                    
                         st.success("✅ **병렬 검색 완료**")
                         st.markdown("### 🎯 **상위 HS코드 후보**")
-                        
+                    
                         for i, result in enumerate(search_results, 1):
                             confidence_color = "🟢" if result['confidence'] == 'HIGH' else "🟡"
                             st.markdown(f"{confidence_color} **후보 {i}: HS코드 {result['hs_code']}** (신뢰도: {result['confidence']})")
-                            
+                        
                             col1, col2 = st.columns([1, 2])
                             with col1:
                                 st.write(f"**최종점수**: {result['final_score']:.3f}")
@@ -366,7 +424,7 @@ for message in st.session_state.chat_history:
                                 if result.get('manual_summary'):
                                     st.write(f"**📖 해설서 요약**:")
                                     st.text(result['manual_summary'][:200] + "...")
-                            
+                        
                             st.divider()
                     else:
                         st.info("🔍 **병렬 검색 시스템으로 분석되었습니다**")
@@ -390,99 +448,99 @@ for message in st.session_state.chat_history:
                             st.divider()
                 else:
                     st.info("분석 과정 정보가 저장되지 않았습니다.")
-            
-            # 최종 답변 표시 (마크다운으로 렌더링)
-            st.markdown("**품목분류 전문가:**")
-            st.markdown(message['content'])
-        
-        # HS 해설서 원문인지 확인
-        elif "+++ HS 해설서 원문 검색 실시 +++" in message['content']:
-            # 마크다운으로 렌더링하여 구조화된 형태로 표시
-            st.markdown("**품목분류 전문가:**")
-            st.markdown(message['content'])
-        else:
-            st.markdown(f"""<div style='background-color: #f0f2f6; padding: 10px; border-radius: 10px; margin-bottom: 10px;'>
-                    <strong>품목분류 전문가:</strong> {message['content']}
-                    </div>""", unsafe_allow_html=True)
-
-
-# 하단 입력 영역 (Form 기반 입력)
-input_container = st.container()
-st.markdown("<div style='flex: 1;'></div>", unsafe_allow_html=True)
-
-with input_container:
-    # Form을 사용하여 안정적인 입력 처리
-    with st.form("query_form", clear_on_submit=True):
-        # 선택된 유형에 따른 placeholder 메시지
-        placeholders = {
-            "AI자동분류": "예: '플라스틱 용기 분류', '반도체 동향' 등 자유롭게 질문하세요",
-            "웹검색": "예: '반도체 시장 동향', '전기차 산업 현황'",
-            "국내HS분류사례 검색": "예: '플라스틱 용기 HS코드', '자동차 부품 분류'",
-            "해외HS분류사례검색": "예: '미국 전자제품 분류', 'EU 화학제품 사례'",
-            "HS해설서분석": "예: '3923, 3924, 3926 중 플라스틱 용기 분류', '8471, 8472 중 컴퓨터 분류'",
-            "HS해설서원문검색": "예: '3911' 또는 '391190' (HS코드만 입력)"
-        }
+    
+        # 답변 본문은 마크다운으로 렌더링 (HTML 문자열 사용하지 않음)
+        st.markdown(message['content'])
+
+
+@st.fragment
+def render_chat():
+    """채팅 기록 및 입력 폼 표시 (이전 대화 더 보기/질문 전송 시 이 영역만 다시 실행)"""
+    # 채팅 기록 표시 영역 (폼 처리 후 채워서 이번 질문/답변까지 한 번에 표시)
+    chat_container = st.container()
+
+    # 하단 입력 영역 (Form 기반 입력)
+    selected_category = get_selected_category()
+    input_container = st.container()
+    with input_container:
+        # Form을 사용하여 안정적인 입력 처리
+        with st.form("query_form", clear_on_submit=True):
+            # 선택된 유형에 따른 placeholder 메시지
+            placeholders = {
+                "AI자동분류": "예: '플라스틱 용기 분류', '반도체 동향' 등 자유롭게 질문하세요",
+                "웹검색": "예: '반도체 시장 동향', '전기차 산업 현황'",
+                "국내HS분류사례 검색": "예: '플라스틱 용기 HS코드', '자동차 부품 분류'",
+                "해외HS분류사례검색": "예: '미국 전자제품 분류', 'EU 화학제품 사례'",
+                "HS해설서분석": "예: '3923, 3924, 3926 중 플라스틱 용기 분류', '8471, 8472 중 컴퓨터 분류'",
+                "HS해설서원문검색": "예: '3911' 또는 '391190' (HS코드만 입력)"
+            }
         
-        user_input = st.text_input(
-            "품목에 대해 질문하세요:", 
-            placeholder=placeholders.get(st.session_state.selected_category, "여기에 입력 후 Enter 또는 전송 버튼 클릭")
-        )
+            user_input = st.text_input(
+                "품목에 대해 질문하세요:", 
+                placeholder=placeholders.get(selected_category, "여기에 입력 후 Enter 또는 전송 버튼 클릭")
+            )
         
-        # 두 개의 컬럼으로 나누어 버튼을 오른쪽에 배치
-        col1, col2 = st.columns([4, 1])
-        with col2:
-            submit_button = st.form_submit_button("전송", use_container_width=True)
+            # 두 개의 컬럼으로 나누어 버튼을 오른쪽에 배치
+            col1, col2 = st.columns([4, 1])
+            with col2:
+                submit_button = st.form_submit_button("전송", use_container_width=True)
         
-        # 폼이 제출되고 입력값이 있을 때 처리
-        if submit_button and user_input and user_input.strip():
-            selected_category = st.session_state.selected_category
-            
-            # HS Manager 인스턴스 가져오기
-            hs_manager = get_hs_manager()
-            
-            # 분석 과정 표시가 필요한 유형들
-            if selected_category in ["국내HS분류사례 검색", "해외HS분류사례검색", "HS해설서분석"]:
-                if selected_category in ["국내HS분류사례 검색", "해외HS분류사례검색"]:
-                    st.session_state.ai_analysis_results = []  # Multi-Agent용 결과 초기화
-                analysis_expander = st.expander("🔍 **AI 분석 과정 보기**", expanded=True)
+            # 폼이 제출되고 입력값이 있을 때 처리
+            if submit_button and user_input and user_input.strip():
+                # HS Manager 인스턴스 가져오기
+                hs_manager = get_hs_manager()
             
-            try:
-                # 분석 과정 표시 방식 분기
-                if selected_category == "HS해설서분석":
-                    # HS 해설서 분석은 사용자 제시 코드 기반 분석 (더미 로거 생성)
-                    class DummyLogger:
-                        def log_actual(self, level, message, data=None):
-                            pass  # UI 표시용이므로 로깅은 생략
+                # 처리 과정 표시 영역 (완료 후 비워서 채팅 기록의 답변과 중복 표시되지 않도록 함)
+                processing_area = st.empty()
+                try:
+                    with processing_area.container():
+                        # 분석 과정 표시가 필요한 유형들
+                        if selected_category in ["국내HS분류사례 검색", "해외HS분류사례검색", "HS해설서분석"]:
+                            if selected_category in ["국내HS분류사례 검색", "해외HS분류사례검색"]:
+                                st.session_state.ai_analysis_results = []  # Multi-Agent용 결과 초기화
+                            analysis_expander = st.expander("🔍 **AI 분석 과정 보기**", expanded=True)
                     
-                    dummy_logger = DummyLogger()
-                    final_answer = handle_hs_manual_with_user_codes(user_input, st.session_state.context, hs_manager, dummy_logger, analysis_expander)
-                    answer = "\n\n +++ HS 해설서 분석 실시 (사용자 제시 코드) +++ \n\n" + final_answer
-                elif selected_category not in ["국내HS분류사례 검색", "해외HS분류사례검색"]:
-                    # 기타 유형은 로그 패널 표시
-                    with st.expander("실시간 처리 과정 로그 보기", expanded=True):
-                        answer = process_query_with_real_logging(user_input)
-                else:
-                    # Multi-Agent 분석용 특별 처리
-                    if selected_category == "국내HS분류사례 검색":
-                        # utils 함수를 직접 호출하되 expander 컨테이너 전달
-                        final_answer = handle_hs_classification_cases(user_input, st.session_state.context, hs_manager, analysis_expander)
-                        answer = "\n\n +++ HS 분류사례 검색 실시 +++\n\n" + final_answer
-                    elif selected_category == "해외HS분류사례검색":
-                        final_answer = handle_overseas_hs(user_input, st.session_state.context, hs_manager, analysis_expander)
-                        answer = "\n\n +++ 해외 HS 분류 검색 실시 +++\n\n" + final_answer
-                
-                # Update chat history after successful processing
-                st.session_state.chat_history.append({"role": "user", "content": user_input})
-                st.session_state.chat_history.append({"role": "assistant", "content": answer})
-                st.session_state.context += f"\n사용자: {user_input}\n품목분류 전문가: {answer}\n"
+                        # 분석 과정 표시 방식 분기
+                        if selected_category == "HS해설서분석":
+                            # HS 해설서 분석은 사용자 제시 코드 기반 분석 (더미 로거 생성)
+                            class DummyLogger:
+                                def log_actual(self, level, message, data=None):
+                                    pass  # UI 표시용이므로 로깅은 생략
+                        
+                            dummy_logger = DummyLogger()
+                            answer = render_answer_stream(handle_hs_manual_with_user_codes(user_input, build_context(), hs_manager, dummy_logger, analysis_expander), "\n\n +++ HS 해설서 분석 실시 (사용자 제시 코드) +++ \n\n")
+                        elif selected_category not in ["국내HS분류사례 검색", "해외HS분류사례검색"]:
+                            # 기타 유형은 로그 패널 표시
+                            with st.expander("실시간 처리 과정 로그 보기", expanded=True):
+                                answer = process_query_with_real_logging(user_input)
+                        else:
+                            # Multi-Agent 분석용 특별 처리 (최종 답변은 expander 아래에 스트리밍 표시)
+                            if selected_category == "국내HS분류사례 검색":
+                                # utils 함수를 직접 호출하되 expander 컨테이너 전달
+                                answer = render_answer_stream(handle_hs_classification_cases(user_input, build_context(), hs_manager, analysis_expander), "\n\n +++ HS 분류사례 검색 실시 +++\n\n")
+                            elif selected_category == "해외HS분류사례검색":
+                                answer = render_answer_stream(handle_overseas_hs(user_input, build_context(), hs_manager, analysis_expander), "\n\n +++ 해외 HS 분류 검색 실시 +++\n\n")
                 
-                # 분석 과정이 표시된 유형들의 최종 답변 표시 (마크다운으로 렌더링)
-                if selected_category in ["국내HS분류사례 검색", "해외HS분류사례검색", "HS해설서분석"]:
-                    st.markdown("**품목분류 전문가:**")
-                    st.markdown(answer)
+                    # Update chat history after successful processing
+                    new_messages = [{"role": "user", "content": user_input}, {"role": "assistant", "content": answer}]
+                    st.session_state.chat_history.extend(new_messages)
+                    st.session_state.history.append((user_input, answer))
                 
-                # Force rerun to display the new chat messages
-                st.rerun()
+                    # 분석 과정/로그 expander 정리 (같은 내용은 채팅 기록의 말풍선에서 표시)
+                    processing_area.empty()
                 
-            except Exception as e:
-                st.error(f"처리 중 오류가 발생했습니다: {str(e)}")
\ No newline at end of file
+                except Exception as e:
+                    st.error(f"처리 중 오류가 발생했습니다: {str(e)}")
+
+    # 채팅 기록 표시 (이번 실행에서 추가된 메시지 포함, 전체 재실행 없이 이 영역만 갱신)
+    with chat_container:
+        history = st.session_state.chat_history
+        hidden_count = len(history) - st.session_state.chat_display_limit
+        if hidden_count > 0 and st.button(f"이전 대화 더 보기 ({hidden_count}개)", key="load_older_messages"):
+            st.session_state.chat_display_limit += CHAT_PAGE_SIZE
+        for message in history[-st.session_state.chat_display_limit:]:
+            render_message(message)
+
+# 채팅 기록 및 입력 영역 표시
+render_chat()
+st.markdown("<div style='flex: 1;'></div>", unsafe_allow_html=True)
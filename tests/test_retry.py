@@ -0,0 +1,77 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+# utils 모듈 import 시 Gemini 클라이언트가 생성되므로 더미 API 키 설정
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+
+
+class FlakyModels:
+    """처음 fail_times 번은 httpx 타임아웃을 발생시키고 이후 정상 응답하는 스텁"""
+
+    def __init__(self, fail_times):
+        self.fail_times = fail_times
+        self.calls = 0
+
+    def generate_content(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise httpx.ReadTimeout("timed out")
+        return SimpleNamespace(text="ok")
+
+    def generate_content_stream(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise httpx.ConnectTimeout("timed out")
+        return iter([SimpleNamespace(text="o"), SimpleNamespace(text="k")])
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(utils.time, "sleep", delays.append)
+    return delays
+
+
+def use_models(monkeypatch, models):
+    monkeypatch.setattr(utils, "client", SimpleNamespace(models=models))
+
+
+def test_generate_content_retries_httpx_timeout(monkeypatch, sleeps):
+    models = FlakyModels(fail_times=2)
+    use_models(monkeypatch, models)
+
+    response = utils.generate_content_with_retry(model="m", contents="q")
+
+    assert response.text == "ok"
+    assert models.calls == 3
+    assert sleeps == [utils.GEMINI_RETRY_BASE_DELAY, utils.GEMINI_RETRY_BASE_DELAY * 2]
+
+
+def test_generate_content_gives_up_after_max_attempts(monkeypatch, sleeps):
+    models = FlakyModels(fail_times=utils.GEMINI_MAX_ATTEMPTS)
+    use_models(monkeypatch, models)
+
+    with pytest.raises(httpx.TimeoutException):
+        utils.generate_content_with_retry(model="m", contents="q")
+    assert models.calls == utils.GEMINI_MAX_ATTEMPTS
+
+
+def test_stream_generate_retries_httpx_timeout_before_first_chunk(monkeypatch, sleeps):
+    models = FlakyModels(fail_times=1)
+    use_models(monkeypatch, models)
+
+    assert "".join(utils.stream_generate("m", "q")) == "ok"
+    assert models.calls == 2
+    assert len(sleeps) == 1
+
+
+def test_connection_reset_is_retryable():
+    assert utils._is_retryable_error(httpx.ConnectError("connection reset"))
+    assert not utils._is_retryable_error(ValueError("bad request"))
@@ -1,20 +1,32 @@
 import json
+import orjson
 import re
 import os
 import requests
 import time
+import httpx
+import numpy as np
 from typing import Dict, List, Any
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from difflib import SequenceMatcher
+from functools import lru_cache
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
 from dotenv import load_dotenv
+import streamlit as st
 
 # 환경 변수 로드 (.env 파일에서 API 키 등 설정값 로드)
 load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 client = genai.Client(api_key=GOOGLE_API_KEY)
 
+def load_json(path):
+    """JSON 파일 로드 (orjson으로 바이트를 직접 파싱하여 stdlib json 대비 로딩 속도 개선)"""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
 class HSDataManager:
     """
     HS 코드 관련 데이터를 관리하는 클래스
@@ -26,9 +38,18 @@ class HSDataManager:
     def __init__(self):
         """HSDataManager 초기화"""
         self.data = {}  # 모든 HS 관련 데이터를 저장하는 딕셔너리
-        self.search_index = defaultdict(list)  # 키워드 기반 검색을 위한 인덱스
+        self.records = []  # 모든 항목을 하나로 모은 리스트 (인덱스 = 항목 id)
+        self.source_names = []  # 출처 코드 → 출처명
+        self.record_sources = np.empty(0, dtype=np.int16)  # 항목 id별 출처 코드 (열 배열)
+        self.source_ranges = {}  # 출처명 → 항목 id 범위 (start, end)
+        self.keyword_ids = {}  # 키워드 → 게시 목록 번호 (검색 인덱스)
+        self.posting_offsets = np.zeros(1, dtype=np.int64)  # 게시 목록별 시작/끝 위치 (CSR 오프셋)
+        self.postings = np.empty(0, dtype=np.int32)  # 모든 게시 목록(항목 id)을 이어 붙인 int32 배열
+        self.manual_index = []  # 해설서 직접 검색용 (항목, 소문자 결합 텍스트) 리스트
         self.load_all_data()  # 모든 데이터 파일 로드
         self.build_search_index()  # 검색 인덱스 구축
+        self.build_manual_index()  # 해설서 검색 인덱스 구축
+        self.tariff_searcher = TariffTableSearcher()  # 관세율표 검색기 (질의마다 재로딩하지 않도록 1회 생성)
     
     def load_all_data(self):
         """
@@ -41,8 +62,7 @@ class HSDataManager:
         # HS분류사례 파트 로드 (1~10)
         for i in range(1, 11):
             try:
-                with open(f'knowledge/HS분류사례_part{i}.json', 'r', encoding='utf-8') as f:
-                    self.data[f'HS분류사례_part{i}'] = json.load(f)
+                self.data[f'HS분류사례_part{i}'] = load_json(f'knowledge/HS분류사례_part{i}.json')
             except FileNotFoundError:
                 print(f'Warning: HS분류사례_part{i}.json not found')
         
@@ -50,38 +70,110 @@ class HSDataManager:
         other_files = ['knowledge/HS위원회.json', 'knowledge/HS협의회.json']
         for file in other_files:
             try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    self.data[file.replace('.json', '')] = json.load(f)
+                self.data[file.replace('.json', '')] = load_json(file)
             except FileNotFoundError:
                 print(f'Warning: {file} not found')
         
         # 미국 관세청 품목분류 사례 로드
         try:
-            with open('knowledge/hs_classification_data_us.json', 'r', encoding='utf-8') as f:
-                self.data['hs_classification_data_us'] = json.load(f)
+            self.data['hs_classification_data_us'] = load_json('knowledge/hs_classification_data_us.json')
         except FileNotFoundError:
             print('Warning: hs_classification_data_us.json not found')
         
         # EU 관세청 품목분류 사례 로드
         try:
-            with open('knowledge/hs_classification_data_eu.json', 'r', encoding='utf-8') as f:
-                self.data['hs_classification_data_eu'] = json.load(f)
+            self.data['hs_classification_data_eu'] = load_json('knowledge/hs_classification_data_eu.json')
         except FileNotFoundError:
             print('Warning: hs_classification_data_eu.json not found')
     
     def build_search_index(self):
         """
         검색 인덱스 구축 메서드
+        - 모든 항목에 정수 id를 부여하고 출처는 열 배열(record_sources)로 관리
         - 각 데이터 항목에서 키워드를 추출
-        - 추출된 키워드를 인덱스에 저장하여 빠른 검색 가능
+        - 추출된 키워드를 인덱스에 항목 id로 저장하여 빠른 검색 가능 (int32 CSR 배열로 압축 보관)
         """
+        search_index = defaultdict(list)  # 구축 중 사용하는 키워드 → 항목 id 리스트
+        source_codes = []
         for source, items in self.data.items():
+            source_code = len(self.source_names)
+            self.source_names.append(source)
+            start = len(self.records)
             for item in items:
+                record_id = len(self.records)
+                self.records.append(item)
+                source_codes.append(source_code)
                 # 품목명에서 키워드 추출
                 keywords = self._extract_keywords(str(item))
-                # 각 키워드에 대해 해당 아이템 참조 저장
+                # 각 키워드에 대해 해당 항목 id 저장
                 for keyword in keywords:
-                    self.search_index[keyword].append((source, item))
+                    search_index[keyword].append(record_id)
+            self.source_ranges[source] = (start, len(self.records))
+        self.record_sources = np.array(source_codes, dtype=np.int16)
+        
+        # 게시 목록을 CSR 형태(연속 int32 배열 + 오프셋)로 압축
+        # 키워드별 파이썬 리스트 대비 메모리 약 1/3, 검색 시 집계는 배열 슬라이스(뷰)로 수행
+        keywords = list(search_index)
+        self.keyword_ids = {keyword: i for i, keyword in enumerate(keywords)}
+        lengths = np.fromiter((len(search_index[keyword]) for keyword in keywords), dtype=np.int64, count=len(keywords))
+        self.posting_offsets = np.zeros(len(keywords) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.posting_offsets[1:])
+        self.postings = np.fromiter(
+            (record_id for keyword in keywords for record_id in search_index[keyword]),
+            dtype=np.int32, count=int(self.posting_offsets[-1])
+        )
+    
+    def build_manual_index(self):
+        """
+        해설서 직접 검색용 인덱스 구축 메서드
+        - 해설서 항목별 헤더와 본문을 소문자로 미리 결합하여 질의마다 파일 로드/문자열 가공을 반복하지 않음
+        """
+        try:
+            manual_data = load_manual_data('knowledge/grouped_11_end.json')
+        except FileNotFoundError:
+            print('Warning: grouped_11_end.json not found')
+            return
+        
+        for item in manual_data:
+            full_text = f"{item.get('header1', '')} {item.get('header2', '')} {item.get('text', '')}".lower()
+            self.manual_index.append((item, full_text))
+    
+    def _rank_records(self, query: str, id_ranges=None, max_results: int = 5) -> List[Dict[str, Any]]:
+        """
+        쿼리 키워드 매칭 횟수 기준으로 항목 순위를 계산하는 내부 메서드
+        Args:
+            query: 검색할 쿼리 문자열
+            id_ranges: 검색 대상 항목 id 범위 리스트 [(start, end), ...] (None이면 전체)
+            max_results: 반환할 최대 결과 수
+        Returns:
+            검색 결과 리스트 (출처와 항목 정보 포함)
+        """
+        postings = []
+        for keyword in self._extract_keywords(query):
+            keyword_id = self.keyword_ids.get(keyword)
+            if keyword_id is not None:
+                postings.append(self.postings[self.posting_offsets[keyword_id]:self.posting_offsets[keyword_id + 1]])
+        if not postings:
+            return []
+        
+        # 항목 id별 매칭 키워드 수 (bincount로 한 번에 집계)
+        counts = np.bincount(np.concatenate(postings), minlength=len(self.records))
+        if id_ranges is not None:
+            mask = np.zeros(len(self.records), dtype=bool)
+            for start, end in id_ranges:
+                mask[start:end] = True
+            counts[~mask] = 0
+        
+        # 가중치 기준 정렬 (동점은 id 순서 유지)
+        top_ids = np.argsort(-counts, kind='stable')[:max_results]
+        return [
+            {'source': self.source_names[self.record_sources[i]], 'item': self.records[i]}
+            for i in top_ids if counts[i] > 0
+        ]
+    
+    def _source_id_ranges(self, sources: List[str]):
+        """출처명 리스트를 항목 id 범위 리스트로 변환"""
+        return [self.source_ranges[source] for source in sources if source in self.source_ranges]
     
     def _extract_keywords(self, text: str) -> List[str]:
         """
@@ -105,29 +197,10 @@ class HSDataManager:
         Returns:
             검색 결과 리스트 (출처와 항목 정보 포함)
         """
-        query_keywords = self._extract_keywords(query)
-        results = defaultdict(int)
-        
-        # 각 키워드에 대해 매칭되는 항목 찾기
-        for keyword in query_keywords:
-            for source, item in self.search_index.get(keyword, []):
-                # 가중치 계산 (키워드 매칭 횟수 기반)
-                results[(source, str(item))] += 1
-        
-        # 가중치 기준 정렬
-        sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
-        
-        # 상위 결과만 반환
-        return [
-            {'source': source, 'item': eval(item_str)}
-            for (source, item_str), _ in sorted_results[:max_results]
-        ]
+        return self._rank_records(query, None, max_results)
     
     def search_domestic_group(self, query: str, group_idx: int, max_results: int = 3) -> List[Dict[str, Any]]:
         """국내 HS 분류 데이터 그룹별 검색 메서드"""
-        query_keywords = self._extract_keywords(query)
-        results = defaultdict(int)
-
         # 그룹별 데이터 소스 정의 (5개 그룹)
         group_sources = [
             ['HS분류사례_part1', 'HS분류사례_part2'],  # 그룹1
@@ -138,16 +211,7 @@ class HSDataManager:
         ]
         sources = group_sources[group_idx]
 
-        for keyword in query_keywords:
-            for source, item in self.search_index.get(keyword, []):
-                if source in sources:
-                    results[(source, str(item))] += 1
-
-        sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
-        return [
-            {'source': source, 'item': eval(item_str)}
-            for (source, item_str), _ in sorted_results[:max_results]
-        ]
+        return self._rank_records(query, self._source_id_ranges(sources), max_results)
 
     def get_domestic_context_group(self, query: str, group_idx: int) -> str:
         """국내 HS 분류 관련 컨텍스트(그룹별)를 생성하는 메서드"""
@@ -159,39 +223,25 @@ class HSDataManager:
 
     def search_overseas_group(self, query: str, group_idx: int, max_results: int = 3) -> List[Dict[str, Any]]:
         """해외 HS 분류 데이터 그룹별 검색 메서드"""
-        query_keywords = self._extract_keywords(query)
-        results = defaultdict(int)
-        
-        # 해외 데이터를 그룹별로 분할 처리
+        # 해외 데이터를 그룹별로 분할 처리 (출처 내 항목 id 범위로 분할)
         if group_idx < 3:  # 그룹 0,1,2는 미국 데이터
             target_source = 'hs_classification_data_us'
             # 미국 데이터를 3등분
-            us_data = self.data.get(target_source, [])
-            chunk_size = len(us_data) // 3
-            start_idx = group_idx * chunk_size
-            end_idx = start_idx + chunk_size if group_idx < 2 else len(us_data)
-            target_items = us_data[start_idx:end_idx]
+            source_start, source_end = self.source_ranges.get(target_source, (0, 0))
+            chunk_size = (source_end - source_start) // 3
+            start_idx = source_start + group_idx * chunk_size
+            end_idx = start_idx + chunk_size if group_idx < 2 else source_end
         else:  # 그룹 3,4는 EU 데이터
             target_source = 'hs_classification_data_eu'
             # EU 데이터를 2등분
-            eu_data = self.data.get(target_source, [])
-            chunk_size = len(eu_data) // 2
+            source_start, source_end = self.source_ranges.get(target_source, (0, 0))
+            chunk_size = (source_end - source_start) // 2
             eu_group_idx = group_idx - 3  # 0 or 1
-            start_idx = eu_group_idx * chunk_size
-            end_idx = start_idx + chunk_size if eu_group_idx < 1 else len(eu_data)
-            target_items = eu_data[start_idx:end_idx]
+            start_idx = source_start + eu_group_idx * chunk_size
+            end_idx = start_idx + chunk_size if eu_group_idx < 1 else source_end
         
         # 해당 그룹 데이터에서만 검색
-        for keyword in query_keywords:
-            for source, item in self.search_index.get(keyword, []):
-                if source == target_source and item in target_items:
-                    results[(source, str(item))] += 1
-        
-        sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
-        return [
-            {'source': source, 'item': eval(item_str)}
-            for (source, item_str), _ in sorted_results[:max_results]
-        ]
+        return self._rank_records(query, [(start_idx, end_idx)], max_results)
 
     def get_overseas_context_group(self, query: str, group_idx: int) -> str:
         """해외 HS 분류 관련 컨텍스트(그룹별)를 생성하는 메서드"""
@@ -213,9 +263,6 @@ class HSDataManager:
     
     def search_domestic(self, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """국내 HS 분류 데이터에서만 검색하는 메서드"""
-        query_keywords = self._extract_keywords(query)
-        results = defaultdict(int)
-        
         # 국내 데이터 소스만 필터링
         domestic_sources = [
             'HS분류사례_part1', 'HS분류사례_part2', 'HS분류사례_part3', 'HS분류사례_part4', 'HS분류사례_part5',
@@ -223,18 +270,7 @@ class HSDataManager:
             'knowledge/HS위원회', 'knowledge/HS협의회'
         ]
         
-        for keyword in query_keywords:
-            for source, item in self.search_index.get(keyword, []):
-                # 국내 데이터 소스만 포함
-                if source in domestic_sources:
-                    results[(source, str(item))] += 1
-        
-        sorted_results = sorted(results.items(), key=lambda x: x[1], reverse=True)
-        
-        return [
-            {'source': source, 'item': eval(item_str)}
-            for (source, item_str), _ in sorted_results[:max_results]
-        ]
+        return self._rank_records(query, self._source_id_ranges(domestic_sources), max_results)
     
     def get_domestic_context(self, query: str) -> str:
         """국내 HS 분류 관련 컨텍스트를 생성하는 메서드"""
@@ -271,12 +307,79 @@ def clean_text(text):
     text = re.sub(r'\s*</div>\s*$', '', text)  # 끝에 있는 </div> 태그 제거
     return text.strip()
 
+# Gemini 호출 재시도 설정 (요청 한도 초과/일시적 서버 오류 시 지수 백오프)
+GEMINI_MAX_ATTEMPTS = 4
+GEMINI_RETRY_BASE_DELAY = 0.5  # 첫 재시도 대기 시간 (초)
+GEMINI_RETRY_MAX_DELAY = 8.0  # 최대 대기 시간 (초)
+
+def _is_retryable_error(error):
+    """재시도할 가치가 있는 일시적 오류인지 판단 (429 요청 한도 초과, 5xx 서버 오류, 타임아웃/연결 끊김)"""
+    # google-genai는 httpx 기반이므로 타임아웃은 httpx.TimeoutException, 연결 재설정 등은 httpx.TransportError로 전달됨
+    if isinstance(error, (TimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, genai_errors.APIError) and (error.code == 429 or (error.code or 0) >= 500)
+
+def _retry_delay(error, attempt):
+    """재시도 전 대기 시간 계산 (Retry-After 헤더가 있으면 우선 사용)"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers:
+        try:
+            return min(float(headers.get('retry-after')), GEMINI_RETRY_MAX_DELAY)
+        except (TypeError, ValueError):
+            pass
+    return min(GEMINI_RETRY_BASE_DELAY * (2 ** (attempt - 1)), GEMINI_RETRY_MAX_DELAY)
+
+def _log_retry(logger, error, attempt, delay):
+    """재시도 로그 출력 (logger는 Streamlit 스크립트 스레드에서만 전달)"""
+    message = f"attempt {attempt + 1}/{GEMINI_MAX_ATTEMPTS} in {delay:.1f}s ({type(error).__name__})"
+    if logger:
+        logger.log_actual("INFO", "Retrying Gemini call", message)
+    else:
+        print(f"Retrying Gemini call: {message}")
+
+def generate_content_with_retry(logger=None, **kwargs):
+    """client.models.generate_content 호출 (일시적 오류 시 지수 백오프로 재시도)"""
+    for attempt in range(1, GEMINI_MAX_ATTEMPTS + 1):
+        try:
+            return client.models.generate_content(**kwargs)
+        except Exception as e:
+            if attempt == GEMINI_MAX_ATTEMPTS or not _is_retryable_error(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(logger, e, attempt, delay)
+            time.sleep(delay)
+
+# Gemini 스트리밍 응답 함수
+def stream_generate(model, contents, config=None, logger=None):
+    """
+    generate_content_stream으로 응답을 받아 텍스트 조각(chunk)을 순서대로 반환하는 제너레이터
+    - 전체 답변이 완성될 때까지 기다리지 않고 첫 토큰부터 화면에 표시 가능
+    - 조각 단위로는 clean_text를 적용하지 않음 (태그가 조각 사이에 걸칠 수 있으므로 호출 측에서 최종 정제)
+    - 첫 조각을 받기 전의 일시적 오류만 재시도 (이미 표시된 답변이 중복되지 않도록)
+    """
+    for attempt in range(1, GEMINI_MAX_ATTEMPTS + 1):
+        started = False
+        try:
+            for chunk in client.models.generate_content_stream(model=model, contents=contents, config=config):
+                if chunk.text:
+                    started = True
+                    yield chunk.text
+            return
+        except Exception as e:
+            if started or attempt == GEMINI_MAX_ATTEMPTS or not _is_retryable_error(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            _log_retry(logger, e, attempt, delay)
+            time.sleep(delay)
+
 # HS 코드 추출 패턴 정의 및 함수
 # 더 유연한 HS 코드 추출 패턴
 HS_PATTERN = re.compile(
     r'(?:HS\s*)?(\d{4}(?:[.-]?\d{2}(?:[.-]?\d{2}(?:[.-]?\d{2})?)?)?)',
     flags=re.IGNORECASE
 )
+NON_DIGIT_PATTERN = re.compile(r'\D')  # 숫자 이외 문자 (코드 표준화용)
+DIGITS_ONLY_PATTERN = re.compile(r'\d{4,}')  # 4자리 이상 연속 숫자
 
 def extract_hs_codes(text):
     """
@@ -288,20 +391,23 @@ def extract_hs_codes(text):
     """
     matches = HS_PATTERN.findall(text)
     hs_codes = []
+    seen = set()
     
     for raw in matches:
         # 숫자만 남기기
-        code = re.sub(r'\D', '', raw)
+        code = NON_DIGIT_PATTERN.sub('', raw)
         # 최소 4자리이고 중복이 아닌 경우만 추가
-        if len(code) >= 4 and code not in hs_codes:
+        if len(code) >= 4 and code not in seen:
+            seen.add(code)
             hs_codes.append(code)
     
     # 만약 위 패턴으로 찾지 못하고, 입력이 4자리 이상의 숫자로만 구성된 경우
     if not hs_codes:
         # 순수 숫자만 있는 경우 체크
-        numbers_only = re.findall(r'\d{4,}', text)
+        numbers_only = DIGITS_ONLY_PATTERN.findall(text)
         for num in numbers_only:
-            if num not in hs_codes:
+            if num not in seen:
+                seen.add(num)
                 hs_codes.append(num)
     
     return hs_codes
@@ -310,8 +416,7 @@ def extract_and_store_text(json_file):
     """JSON 파일에서 head1과 text를 추출하여 변수에 저장"""
     try:
         # JSON 파일 읽기
-        with open(json_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        data = load_json(json_file)
         
         # 데이터를 변수에 저장
         extracted_data = []
@@ -329,11 +434,27 @@ def extract_and_store_text(json_file):
 # 통칙 데이터 로드 (재사용을 위한 전역 변수)
 general_explanation = extract_and_store_text('knowledge/통칙_grouped.json')
 
+@lru_cache(maxsize=None)
+def load_manual_data(json_file):
+    """해설서 JSON 파일을 한 번만 로드하여 재사용 (반환값은 읽기 전용으로 사용)"""
+    return load_json(json_file)
+
+@lru_cache(maxsize=None)
+def load_manual_header_index(json_file):
+    """해설서 항목을 header1(부)/header2(류·호) 값으로 찾는 사전을 한 번만 구축 (값별 첫 항목 사용)"""
+    by_header1, by_header2 = {}, {}
+    for g in load_manual_data(json_file):
+        header1 = g.get('header1')
+        # 부(部) key는 "제00부" 형태(공백 없음)로 표기된 항목만 사용
+        if header1 is not None and re.sub(r'제\s*(\d+)\s*부', r'제\1부', header1) == header1:
+            by_header1.setdefault(header1, g)
+        by_header2.setdefault(g.get('header2'), g)
+    return by_header1, by_header2
+
 def lookup_hscode(hs_code, json_file):
     """HS 코드에 대한 해설 정보를 조회하는 함수"""
     try:
-        with open(json_file, 'r', encoding='utf-8') as file:
-            data = json.load(file)
+        by_header1, by_header2 = load_manual_header_index(json_file)
         
         # 각 설명 유형별 초기값 설정
         part_explanation = {"text": "해당 부에 대한 설명을 찾을 수 없습니다."}
@@ -342,16 +463,16 @@ def lookup_hscode(hs_code, json_file):
 
         # 1) 류(類) key: "제00류"
         chapter_key = f"제{int(hs_code[:2])}류"
-        chapter_explanation = next((g for g in data if g.get('header2') == chapter_key), chapter_explanation)
+        chapter_explanation = by_header2.get(chapter_key, chapter_explanation)
 
         # 2) 호 key: "00.00" (4자리까지만 사용)
         hs_4digit = hs_code[:4]  # 4자리까지만 추출
         sub_key = f"{hs_4digit[:2]}.{hs_4digit[2:]}"
-        sub_explanation = next((g for g in data if g.get('header2') == sub_key), sub_explanation)
+        sub_explanation = by_header2.get(sub_key, sub_explanation)
 
         # 3) 부(部) key: "제00부"
         part_key = chapter_explanation.get('header1') if chapter_explanation else None
-        part_explanation = next((g for g in data if (g.get('header1') == part_key)&(re.sub(r'제\s*(\d+)\s*부', r'제\1부', g.get('header1')) == part_key)), None)
+        part_explanation = by_header1.get(part_key)
         
         return part_explanation, chapter_explanation, sub_explanation
     
@@ -359,35 +480,44 @@ def lookup_hscode(hs_code, json_file):
         print(f"HS 코드 조회 오류: {e}")
         return ({"text": "오류가 발생했습니다."}, {"text": "오류가 발생했습니다."}, {"text": "오류가 발생했습니다."})
 
-def get_hs_explanations(hs_codes):
-    """여러 HS 코드에 대한 해설을 취합하는 함수 (마크다운 형식)"""
-    all_explanations = ""
-    for hs_code in hs_codes:
-        explanation, type_explanation, number_explanation = lookup_hscode(hs_code, 'knowledge/grouped_11_end.json')
+def _format_hs_explanation(hs_code):
+    """단일 HS 코드의 해설을 마크다운으로 구성 (해설 문자열, 소요 시간) 반환"""
+    start_time = time.perf_counter()
+    explanation, type_explanation, number_explanation = lookup_hscode(hs_code, 'knowledge/grouped_11_end.json')
 
-        if explanation and type_explanation and number_explanation:
-            all_explanations += f"\n\n# HS 코드 {hs_code} 해설\n\n"
-            all_explanations += f"## 📋 해설서 통칙\n\n"
-            
-            # 통칙 내용을 리스트 형태로 정리
-            if general_explanation:
-                for i, rule in enumerate(general_explanation[:5], 1):  # 처음 5개만 표시
-                    all_explanations += f"### 통칙 {i}\n{rule}\n\n"
-            
-            all_explanations += f"## 📂 부(部) 해설\n\n{explanation['text']}\n\n"
-            all_explanations += f"## 📚 류(類) 해설\n\n{type_explanation['text']}\n\n"
-            all_explanations += f"## 📝 호(號) 해설\n\n{number_explanation['text']}\n\n"
-            all_explanations += "---\n"  # 구분선 추가
+    parts = []
+    if explanation and type_explanation and number_explanation:
+        parts.append(f"\n\n# HS 코드 {hs_code} 해설\n\n")
+        parts.append(f"## 📋 해설서 통칙\n\n")
+        
+        # 통칙 내용을 리스트 형태로 정리
+        if general_explanation:
+            for i, rule in enumerate(general_explanation[:5], 1):  # 처음 5개만 표시
+                parts.append(f"### 통칙 {i}\n{rule}\n\n")
+        
+        parts.append(f"## 📂 부(部) 해설\n\n{explanation['text']}\n\n")
+        parts.append(f"## 📚 류(類) 해설\n\n{type_explanation['text']}\n\n")
+        parts.append(f"## 📝 호(號) 해설\n\n{number_explanation['text']}\n\n")
+        parts.append("---\n")  # 구분선 추가
     
-    return all_explanations
+    return "".join(parts), time.perf_counter() - start_time
 
-def get_tariff_info_for_codes(hs_codes):
-    """HS코드들에 대한 품목분류표 정보 수집"""
+def get_hs_explanations(hs_codes, logger=None):
+    """여러 HS 코드에 대한 해설을 조회하여 취합하는 함수 (마크다운 형식, 입력 순서 유지)"""
+    explanations = []
+    for hs_code in hs_codes:
+        text, elapsed = _format_hs_explanation(hs_code)
+        if logger:
+            logger.log_actual("DATA", f"HS{hs_code} explanation loaded", f"{elapsed:.3f}s")
+        explanations.append(text)
+    return "".join(explanations)
+
+def get_tariff_info_for_codes(hs_codes, hs_manager):
+    """HS코드들에 대한 품목분류표 정보 수집 (HSDataManager에 1회 로드된 관세율표 재사용)"""
     tariff_info = {}
     
     try:
-        with open('knowledge/hstable.json', 'r', encoding='utf-8') as f:
-            tariff_data = json.load(f)
+        tariff_data = hs_manager.tariff_searcher.tariff_data
         
         for code in hs_codes:
             # 4자리 HS코드로 매칭 (예: 3923 또는 39.23)
@@ -409,8 +539,9 @@ def get_tariff_info_for_codes(hs_codes):
     return tariff_info
 
 def get_manual_info_for_codes(hs_codes, logger):
-    """HS코드들에 대한 해설서 정보 수집 및 요약"""
+    """HS코드들에 대한 해설서 정보 수집 및 요약 (요약이 필요한 코드는 Gemini 병렬 호출)"""
     manual_info = {}
+    summary_targets = {}  # 요약 대상 HS코드 → 해설서 내용
     
     for code in hs_codes:
         try:
@@ -426,10 +557,27 @@ def get_manual_info_for_codes(hs_codes, logger):
             if sub_exp and sub_exp.get('text'):
                 full_content += f"호 해설: {sub_exp['text']}\n\n"
             
-            # 1000자 초과 시 요약
+            # 1000자 초과 시 요약 (아래에서 병렬 처리)
             if len(full_content) > 1000:
                 logger.log_actual("AI", f"Summarizing manual content for HS{code}...")
-                summary_prompt = f"""다음 HS 해설서 내용을 1000자 이내로 핵심 내용만 요약해주세요:
+                summary_targets[code] = full_content
+                manual_info[code] = None  # 입력 순서 유지를 위한 자리 확보
+            else:
+                manual_info[code] = {
+                    'content': full_content,
+                    'summary_used': False
+                }
+                
+        except Exception as e:
+            logger.log_actual("ERROR", f"HS{code} manual loading failed: {str(e)}")
+            manual_info[code] = {
+                'content': "해설서 정보를 찾을 수 없습니다.",
+                'summary_used': False
+            }
+    
+    def summarize_manual_content(code, full_content):
+        """단일 HS코드 해설서 요약 (작업 스레드에서 실행되므로 로그는 호출 측에서 출력)"""
+        summary_prompt = f"""다음 HS 해설서 내용을 1000자 이내로 핵심 내용만 요약해주세요:
 
 HS코드: {code}
 해설서 내용:
@@ -442,43 +590,39 @@ HS코드: {code}
 - 핵심 특징
 
 간결하고 정확하게 요약해주세요."""
-                
+        
+        summary_response = generate_content_with_retry(
+            model="gemini-2.0-flash",
+            contents=summary_prompt
+        )
+        return clean_text(summary_response.text)
+    
+    # 코드별 요약 병렬 호출 (총 소요 시간: 호출 시간의 합 → 최댓값)
+    if summary_targets:
+        with ThreadPoolExecutor(max_workers=len(summary_targets)) as executor:
+            futures = {executor.submit(summarize_manual_content, code, full_content): code for code, full_content in summary_targets.items()}
+            
+            for future in as_completed(futures):
+                code = futures[future]
                 try:
-                    summary_response = client.models.generate_content(
-                        model="gemini-2.0-flash",
-                        contents=summary_prompt
-                    )
                     manual_info[code] = {
-                        'content': clean_text(summary_response.text),
+                        'content': future.result(),
                         'summary_used': True
                     }
                     logger.log_actual("SUCCESS", f"HS{code} manual summarized", f"{len(manual_info[code]['content'])} chars")
                 except Exception as e:
                     logger.log_actual("ERROR", f"HS{code} summary failed: {str(e)}")
                     manual_info[code] = {
-                        'content': full_content[:1000] + "...",
+                        'content': summary_targets[code][:1000] + "...",
                         'summary_used': False
                     }
-            else:
-                manual_info[code] = {
-                    'content': full_content,
-                    'summary_used': False
-                }
-        
-        except Exception as e:
-            logger.log_actual("ERROR", f"HS{code} manual loading failed: {str(e)}")
-            manual_info[code] = {
-                'content': "해설서 정보를 찾을 수 없습니다.",
-                'summary_used': False
-            }
     
     return manual_info
 
 def prepare_general_rules():
     """HS 분류 통칙 준비"""
     try:
-        with open('knowledge/통칙_grouped.json', 'r', encoding='utf-8') as f:
-            rules_data = json.load(f)
+        rules_data = load_json('knowledge/통칙_grouped.json')
         
         rules_text = "HS 분류 통칙:\n\n"
         for i, rule in enumerate(rules_data[:6], 1):  # 통칙 1~6
@@ -488,8 +632,8 @@ def prepare_general_rules():
     except Exception as e:
         return "통칙 정보를 로드할 수 없습니다."
 
-def analyze_user_provided_codes(user_input, hs_codes, tariff_info, manual_info, general_rules, context):
-    """사용자 제시 HS코드들에 대한 최종 AI 분석"""
+def analyze_user_provided_codes(user_input, hs_codes, tariff_info, manual_info, general_rules, context, logger=None):
+    """사용자 제시 HS코드들에 대한 최종 AI 분석 (답변 조각을 반환하는 제너레이터)"""
     
     # HS 해설서 분석 전용 맞춤형 프롬프트
     manual_analysis_context = """당신은 HS 해설서 및 품목분류표 전문 분석가입니다.
@@ -557,48 +701,49 @@ def analyze_user_provided_codes(user_input, hs_codes, tariff_info, manual_info,
 
 전문적이면서도 이해하기 쉽게 답변해주세요."""
     
-    # Gemini AI 분석 수행
+    # Gemini AI 분석 수행 (스트리밍)
     try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=analysis_prompt
-        )
-        return clean_text(response.text)
+        yield from stream_generate("gemini-2.5-flash", analysis_prompt, logger=logger)
     except Exception as e:
-        return f"AI 분석 중 오류가 발생했습니다: {str(e)}"
+        yield f"AI 분석 중 오류가 발생했습니다: {str(e)}"
 
 class TariffTableSearcher:
     def __init__(self):
         self.tariff_data = []
+        self.name_index = []  # (HS코드, 한글품명, 영문품명, 소문자 한글품명, 소문자 영문품명)
         self.load_tariff_table()
     
     def load_tariff_table(self):
-        """관세율표 데이터 로드"""
+        """관세율표 데이터 로드 및 품명 비교용 소문자 텍스트 사전 계산"""
         try:
-            with open('knowledge/hstable.json', 'r', encoding='utf-8') as f:
-                self.tariff_data = json.load(f)
+            self.tariff_data = load_json('knowledge/hstable.json')
         except FileNotFoundError:
             print("Warning: hstable.json not found")
             self.tariff_data = []
+        
+        self.name_index = []
+        for item in self.tariff_data:
+            korean_name = item.get('한글품명', '')
+            english_name = item.get('영문품명', '')
+            self.name_index.append((item.get('품목번호', ''), korean_name, english_name, korean_name.lower(), english_name.lower()))
     
-    def calculate_similarity(self, query, text):
-        """텍스트 유사도 계산"""
-        if not query or not text:
+    def calculate_similarity(self, query_lower, text_lower):
+        """텍스트 유사도 계산 (이미 소문자로 변환된 문자열을 받음)"""
+        if not query_lower or not text_lower:
             return 0.0
-        return SequenceMatcher(None, query.lower(), text.lower()).ratio()
+        return SequenceMatcher(None, query_lower, text_lower).ratio()
     
     def search_by_tariff_table(self, query, top_n=10):
         """관세율표에서 유사도 기반 HS코드 후보 검색"""
         candidates = []
-        
-        for item in self.tariff_data:
-            hs_code = item.get('품목번호', '')
-            korean_name = item.get('한글품명', '')
-            english_name = item.get('영문품명', '')
-            
-            # 한글품명과 영문품명에서 유사도 계산
-            korean_sim = self.calculate_similarity(query, korean_name)
-            english_sim = self.calculate_similarity(query, english_name)
+        if not query:
+            return candidates
+        query_lower = query.lower()
+        
+        for hs_code, korean_name, english_name, korean_lower, english_lower in self.name_index:
+            # 한글품명과 영문품명에서 유사도 계산 (소문자 변환은 사전 계산된 값 사용)
+            korean_sim = self.calculate_similarity(query_lower, korean_lower)
+            english_sim = self.calculate_similarity(query_lower, english_lower)
             
             # 최고 유사도 사용
             max_similarity = max(korean_sim, english_sim)
@@ -619,7 +764,7 @@ class TariffTableSearcher:
 class ParallelHSSearcher:
     def __init__(self, hs_manager):
         self.hs_manager = hs_manager
-        self.tariff_searcher = TariffTableSearcher()
+        self.tariff_searcher = hs_manager.tariff_searcher  # HSDataManager에서 1회 구축된 검색기 재사용
     
     def parallel_search(self, query, logger, ui_container=None):
         """병렬적 HS코드 검색"""
@@ -641,9 +786,9 @@ class ParallelHSSearcher:
     def tariff_to_manual_search(self, query, logger):
         """경로 1: 관세율표 → 해설서"""
         # 1단계: 관세율표에서 HS코드 후보 선정
-        tariff_start = time.time()
+        tariff_start = time.perf_counter()
         hs_candidates = self.tariff_searcher.search_by_tariff_table(query, top_n=15)
-        tariff_time = time.time() - tariff_start
+        tariff_time = time.perf_counter() - tariff_start
         
         logger.log_actual("DATA", f"Tariff table search completed", 
                          f"{len(hs_candidates)} candidates in {tariff_time:.2f}s")
@@ -657,7 +802,7 @@ class ParallelHSSearcher:
                          f"{', '.join(candidate_codes[:5])}...")
         
         # 2단계: 해당 HS코드들을 해설서에서 검색
-        manual_start = time.time()
+        manual_start = time.perf_counter()
         manual_results = []
         
         for candidate in hs_candidates[:10]:
@@ -673,7 +818,7 @@ class ParallelHSSearcher:
                     'source': 'tariff_to_manual'
                 })
         
-        manual_time = time.time() - manual_start
+        manual_time = time.perf_counter() - manual_start
         logger.log_actual("SUCCESS", f"Manual search for candidates completed", 
                          f"{len(manual_results)} results in {manual_time:.2f}s")
         
@@ -698,40 +843,31 @@ class ParallelHSSearcher:
     
     def direct_manual_search(self, query, logger):
         """경로 2: 해설서 직접 검색"""
-        manual_start = time.time()
+        manual_start = time.perf_counter()
         
         # 해설서 데이터에서 직접 검색
         direct_results = []
         try:
-            with open('knowledge/grouped_11_end.json', 'r', encoding='utf-8') as f:
-                manual_data = json.load(f)
-            
-            # 쿼리 키워드 추출
-            query_keywords = self.extract_keywords_from_query(query)
+            # 쿼리 키워드 추출 (소문자 변환은 1회만)
+            query_keywords = [keyword.lower() for keyword in self.extract_keywords_from_query(query)]
             
-            # 해설서 텍스트에서 매칭되는 항목 찾기
-            for item in manual_data:
-                text_content = item.get('text', '')
-                header1 = item.get('header1', '')
-                header2 = item.get('header2', '')
-                
+            # 해설서 텍스트에서 매칭되는 항목 찾기 (사전 구축된 소문자 결합 텍스트 사용)
+            for item, full_text in self.hs_manager.manual_index:
                 # 텍스트 내용과 헤더에서 키워드 매칭
                 match_score = 0
-                full_text = f"{header1} {header2} {text_content}".lower()
-                
                 for keyword in query_keywords:
-                    if keyword.lower() in full_text:
+                    if keyword in full_text:
                         match_score += 1
                 
                 if match_score > 0:
                     # HS코드 추출 (header2에서)
-                    hs_codes = self.extract_hs_from_header(header2)
+                    hs_codes = self.extract_hs_from_header(item.get('header2', ''))
                     
                     direct_results.append({
                         'hs_codes': hs_codes,
                         'content': item,
                         'match_score': match_score,
-                        'text_content': text_content,
+                        'text_content': item.get('text', ''),
                         'source': 'direct_manual'
                     })
             
@@ -743,7 +879,7 @@ class ParallelHSSearcher:
             logger.log_actual("ERROR", f"Manual search error: {str(e)}")
             direct_results = []
         
-        manual_time = time.time() - manual_start
+        manual_time = time.perf_counter() - manual_start
         logger.log_actual("SUCCESS", f"Direct manual search completed", 
                          f"{len(direct_results)} results in {manual_time:.2f}s")
         
@@ -788,29 +924,27 @@ class ParallelHSSearcher:
     
     def consolidate_results(self, path1_results, path2_results, logger):
         """두 경로의 결과를 종합"""
-        consolidation_start = time.time()
+        consolidation_start = time.perf_counter()
         
         # 가중치 설정
         TARIFF_WEIGHT = 0.4  # 관세율표 경로 가중치
         MANUAL_WEIGHT = 0.6  # 해설서 직접 경로 가중치
         
-        final_scores = defaultdict(float)
+        tariff_raw_scores = defaultdict(float)  # 관세율표 유사도 합계 (가중치 적용 전)
+        manual_raw_scores = defaultdict(float)  # 해설서 직접 검색 점수 합계 (가중치 적용 전)
         result_details = {}
         
         # 경로 1 결과 처리 (관세율표 → 해설서)
         for result in path1_results:
             hs_code = result['hs_code']
-            # 관세율표 유사도 * 가중치
-            score = result['tariff_similarity'] * TARIFF_WEIGHT
-            final_scores[hs_code] += score
+            # 관세율표 유사도 합산
+            tariff_raw_scores[hs_code] += result['tariff_similarity']
             
             if hs_code not in result_details:
                 result_details[hs_code] = {
                     'hs_code': hs_code,
                     'tariff_name': result.get('tariff_name', ''),
                     'manual_content': result.get('manual_content', ''),
-                    'path1_score': score,
-                    'path2_score': 0,
                     'sources': ['tariff_to_manual']
                 }
             else:
@@ -822,36 +956,41 @@ class ParallelHSSearcher:
             extracted_codes = self.extract_hs_codes_from_content(result['content'])
             
             for hs_code in extracted_codes:
-                # 해설서 직접 검색 점수 (빈도 기반)
-                score = 0.5 * MANUAL_WEIGHT  # 기본 점수
-                final_scores[hs_code] += score
+                # 해설서 직접 검색 점수 (빈도 기반, 발견 시마다 기본 점수 0.5)
+                manual_raw_scores[hs_code] += 0.5
                 
                 if hs_code not in result_details:
                     result_details[hs_code] = {
                         'hs_code': hs_code,
                         'tariff_name': '',
                         'manual_content': str(result['content']),
-                        'path1_score': 0,
-                        'path2_score': score,
                         'sources': ['direct_manual']
                     }
                 else:
-                    result_details[hs_code]['path2_score'] += score
                     if 'direct_manual' not in result_details[hs_code]['sources']:
                         result_details[hs_code]['sources'].append('direct_manual')
         
-        # 최종 순위 정렬
-        sorted_results = sorted(final_scores.items(), key=lambda x: x[1], reverse=True)
+        # 경로별 가중 점수 및 최종 점수 계산 (HS코드별 점수를 배열로 모아 가중치는 여기서만 적용)
+        codes = list(result_details)
+        path1_scores = TARIFF_WEIGHT * np.fromiter((tariff_raw_scores[code] for code in codes), dtype=np.float64, count=len(codes))
+        path2_scores = MANUAL_WEIGHT * np.fromiter((manual_raw_scores[code] for code in codes), dtype=np.float64, count=len(codes))
+        final_scores = path1_scores + path2_scores
         
-        consolidation_time = time.time() - consolidation_start
+        # 최종 순위 정렬 (동점은 먼저 발견된 코드 우선)
+        order = np.argsort(-final_scores, kind='stable')
+        sorted_results = [(codes[i], float(path1_scores[i]), float(path2_scores[i]), float(final_scores[i])) for i in order]
+        
+        consolidation_time = time.perf_counter() - consolidation_start
         logger.log_actual("SUCCESS", f"Results consolidation completed", 
                          f"{len(sorted_results)} unique HS codes in {consolidation_time:.2f}s")
         
         # 상위 5개 결과 반환
         top_results = []
-        for hs_code, final_score in sorted_results[:5]:
+        for hs_code, path1_score, path2_score, final_score in sorted_results[:5]:
             if hs_code in result_details:
                 details = result_details[hs_code]
+                details['path1_score'] = path1_score
+                details['path2_score'] = path2_score
                 details['final_score'] = final_score
                 details['confidence'] = 'HIGH' if len(details['sources']) > 1 else 'MEDIUM'
                 top_results.append(details)
@@ -882,7 +1021,7 @@ class ParallelHSSearcher:
         return context
 
 def handle_hs_manual_with_user_codes(user_input, context, hs_manager, logger, ui_container=None):
-    """사용자 제시 HS코드 기반 해설서 분석"""
+    """사용자 제시 HS코드 기반 해설서 분석 (최종 답변을 스트리밍으로 반환하는 제너레이터)"""
     import streamlit as st
     
     # UI 컨테이너가 제공된 경우 분석 과정 표시
@@ -902,7 +1041,8 @@ def handle_hs_manual_with_user_codes(user_input, context, hs_manager, logger, ui
             progress_bar.progress(1.0, text="분석 완료!")
             st.error("❌ **HS코드를 찾을 수 없습니다**")
             st.info("💡 **사용법**: '3923, 3924, 3926 중에서 플라스틱 용기를 분류해주세요' 형태로 질문하세요")
-        return "HS코드를 찾을 수 없습니다. 분석할 HS코드를 포함하여 질문해주세요."
+        yield "HS코드를 찾을 수 없습니다. 분석할 HS코드를 포함하여 질문해주세요."
+        return
     
     logger.log_actual("SUCCESS", f"Found {len(extracted_codes)} HS codes", f"{', '.join(extracted_codes)}")
     
@@ -913,7 +1053,7 @@ def handle_hs_manual_with_user_codes(user_input, context, hs_manager, logger, ui
     
     # 2단계: 각 HS코드별 품목분류표 정보 수집
     logger.log_actual("INFO", "Collecting tariff table information...")
-    tariff_info = get_tariff_info_for_codes(extracted_codes)
+    tariff_info = get_tariff_info_for_codes(extracted_codes, hs_manager)
     
     if ui_container:
         progress_bar.progress(0.4, text="품목분류표 정보 수집 중...")
@@ -955,18 +1095,20 @@ def handle_hs_manual_with_user_codes(user_input, context, hs_manager, logger, ui
     
     # 5단계: 최종 AI 분석
     logger.log_actual("AI", "Starting final AI analysis...")
-    final_answer = analyze_user_provided_codes(user_input, extracted_codes, tariff_info, manual_info, general_rules, context)
+    output_chars = 0
+    for chunk in analyze_user_provided_codes(user_input, extracted_codes, tariff_info, manual_info, general_rules, context, logger):
+        output_chars += len(chunk)
+        yield chunk
     
     if ui_container:
         progress_bar.progress(1.0, text="분석 완료!")
         st.success("🧠 **AI 전문가 분석이 완료되었습니다**")
         st.info("📋 **아래에서 최종 답변을 확인하세요**")
     
-    logger.log_actual("SUCCESS", "User-provided codes analysis completed", f"{len(final_answer)} chars")
-    return final_answer
+    logger.log_actual("SUCCESS", "User-provided codes analysis completed", f"{output_chars} chars")
 
 def handle_hs_manual_with_parallel_search(user_input, context, hs_manager, logger, ui_container=None):
-    """병렬 검색을 활용한 HS 해설서 분석"""
+    """병렬 검색을 활용한 HS 해설서 분석 (최종 답변을 스트리밍으로 반환하는 제너레이터)"""
     import streamlit as st
     
     # UI 컨테이너가 제공된 경우 분석 과정 표시
@@ -1013,11 +1155,11 @@ def handle_hs_manual_with_parallel_search(user_input, context, hs_manager, logge
         progress_bar.progress(0.7, text="해설서 내용 요약 중...")
     
     logger.log_actual("AI", "Starting manual content summarization...")
-    summary_start = time.time()
+    summary_start = time.perf_counter()
     
-    for i, result in enumerate(search_results):
-        if result['manual_content']:
-            summary_prompt = f"""다음 HS 해설서 내용을 1000자 이내로 핵심 내용만 요약해주세요:
+    # 요약 처리용 함수 (후보별 독립 호출이므로 병렬 실행, UI/로그 출력은 호출 스레드에서 수행)
+    def summarize_single_result(result):
+        summary_prompt = f"""다음 HS 해설서 내용을 1000자 이내로 핵심 내용만 요약해주세요:
 
 HS코드: {result['hs_code']}
 해설서 원문:
@@ -1030,21 +1172,33 @@ HS코드: {result['hs_code']}
 - 핵심 특징
 
 간결하고 정확하게 요약해주세요."""
-            
-            try:
-                summary_response = client.models.generate_content(
-                    model="gemini-2.0-flash",
-                    contents=summary_prompt
-                )
-                result['manual_summary'] = clean_text(summary_response.text)
-                logger.log_actual("SUCCESS", f"HS코드 {result['hs_code']} 해설서 요약 완료", f"{len(result['manual_summary'])} chars")
-            except Exception as e:
-                logger.log_actual("ERROR", f"HS코드 {result['hs_code']} 요약 실패: {str(e)}")
-                result['manual_summary'] = result['manual_content'][:1000] + "..." if len(result['manual_content']) > 1000 else result['manual_content']
-        else:
+        
+        summary_response = generate_content_with_retry(
+            model="gemini-2.0-flash",
+            contents=summary_prompt
+        )
+        return clean_text(summary_response.text)
+    
+    for result in search_results:
+        if not result['manual_content']:
             result['manual_summary'] = ""
     
-    summary_time = time.time() - summary_start
+    # 후보별 요약 병렬 호출 (총 소요 시간: 호출 시간의 합 → 최댓값)
+    targets = [result for result in search_results if result['manual_content']]
+    if targets:
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures = {executor.submit(summarize_single_result, result): result for result in targets}
+            
+            for future in as_completed(futures):
+                result = futures[future]
+                try:
+                    result['manual_summary'] = future.result()
+                    logger.log_actual("SUCCESS", f"HS코드 {result['hs_code']} 해설서 요약 완료", f"{len(result['manual_summary'])} chars")
+                except Exception as e:
+                    logger.log_actual("ERROR", f"HS코드 {result['hs_code']} 요약 실패: {str(e)}")
+                    result['manual_summary'] = result['manual_content'][:1000] + "..." if len(result['manual_content']) > 1000 else result['manual_content']
+    
+    summary_time = time.perf_counter() - summary_start
     logger.log_actual("SUCCESS", f"Manual content summarization completed", f"{summary_time:.2f}s")
 
     # 2단계: 해설서 요약 완료 후 업데이트된 정보 표시
@@ -1082,7 +1236,7 @@ HS코드: {result['hs_code']}
         
         # 현재 분석 결과 저장
         current_analysis = {
-            'timestamp': time.time(),
+            'timestamp': time.time(),  # 저장 시각 (벽시계)
             'search_results': search_results,
             'query': user_input
         }
@@ -1148,28 +1302,25 @@ HS코드: {result['hs_code']}
 답변은 전문적이면서도 이해하기 쉽게 작성해주세요.
 """
     
-    # Gemini 처리
+    # Gemini 처리 (스트리밍)
     logger.log_actual("AI", "Processing with enhanced parallel search context...")
-    ai_processing_start = time.time()
+    ai_processing_start = time.perf_counter()
     
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
+    output_chars = 0
+    for chunk in stream_generate("gemini-2.5-flash", prompt, logger=logger):
+        output_chars += len(chunk)
+        yield chunk
     
-    ai_processing_time = time.time() - ai_processing_start
-    final_answer = clean_text(response.text)
+    ai_processing_time = time.perf_counter() - ai_processing_start
     
     logger.log_actual("SUCCESS", "Gemini processing completed", 
-                     f"{ai_processing_time:.2f}s, input: {len(prompt)} chars, output: {len(final_answer)} chars")
+                     f"{ai_processing_time:.2f}s, input: {len(prompt)} chars, output: {output_chars} chars")
     
     # UI 최종 완료 표시
     if ui_container:
         progress_bar.progress(1.0, text="분석 완료!")
         st.success("🧠 **AI 전문가 분석이 완료되었습니다**")
         st.info("📋 **패널을 접고 아래에서 최종 답변을 확인하세요**")
-    
-    return final_answer
 
 # 질문 유형 분류 함수 (LLM 기반)
 def classify_question(user_input):
@@ -1179,7 +1330,14 @@ def classify_question(user_input):
     - 'hs_classification': HS 코드, 품목분류, 관세 등
     - 'hs_manual': HS 해설서 본문 심층 분석
     - 'overseas_hs': 해외(미국/EU) HS 분류 사례
+    공백/대소문자를 정규화한 입력 기준으로 결과를 캐싱하여 반복 질문은 LLM 호출 생략
     """
+    return _classify_cached(" ".join(user_input.lower().split()))
+
+# 분류 결과는 사용자와 무관하므로 전역 캐시 사용 (1시간 유지)
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def _classify_cached(user_input):
+    """정규화된 입력에 대해 실제 LLM 분류 수행"""
     system_prompt = """
 아래는 HS 품목분류 전문가를 위한 질문 유형 분류 기준입니다.
 
@@ -1193,7 +1351,7 @@ def classify_question(user_input):
 아래 사용자 질문을 읽고, 반드시 위 다섯 가지 중 하나의 유형만 한글이 아닌 소문자 영문으로 답변하세요.
 질문: """ + user_input + """\n답변:"""
 
-    response = client.models.generate_content(
+    response = generate_content_with_retry(
         model="gemini-2.0-flash", # 또는 최신 모델로 변경 가능
         contents=system_prompt,
         )
@@ -1206,6 +1364,7 @@ def classify_question(user_input):
 
 # 질문 유형별 처리 함수
 def handle_web_search(user_input, context, hs_manager):
+    """웹 검색 기반 답변 (스트리밍 제너레이터)"""
     # 웹검색 전용 컨텍스트
     web_context = """당신은 HS 품목분류 전문가입니다. 
 
@@ -1217,15 +1376,10 @@ def handle_web_search(user_input, context, hs_manager):
     
     prompt = f"{web_context}\n\n사용자: {user_input}\n"
     
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config=config)
-    
-    return clean_text(response.text)
+    yield from stream_generate("gemini-2.5-flash", prompt, config=config)
 
 def handle_hs_classification_cases(user_input, context, hs_manager, ui_container=None):
-    """국내 HS 분류 사례 처리 (그룹별 Gemini + Head Agent)"""
+    """국내 HS 분류 사례 처리 (그룹별 Gemini + Head Agent, 최종 답변 스트리밍)"""
     import streamlit as st
     from datetime import datetime
     
@@ -1258,25 +1412,25 @@ def handle_hs_classification_cases(user_input, context, hs_manager, ui_container
         relevant = hs_manager.get_domestic_context_group(user_input, i)
         prompt = f"{domestic_context}\n\n관련 데이터 (국내 관세청, 그룹{i+1}):\n{relevant}\n\n사용자: {user_input}\n"
         
-        start_time = datetime.now()
-        response = client.models.generate_content(
+        start_time = datetime.now()  # 화면 표시용 시작 시각
+        start_counter = time.perf_counter()
+        response = generate_content_with_retry(
             model="gemini-2.5-flash",
             contents=prompt
         )
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
+        processing_time = time.perf_counter() - start_counter
         
         answer = clean_text(response.text)
         return i, answer, start_time, processing_time
     
-    # 5개 그룹 병렬 처리 (max_workers=3)
+    # 5개 그룹 병렬 처리 (max_workers=5, 그룹별 호출을 한 번에 동시 실행)
     from concurrent.futures import ThreadPoolExecutor, as_completed
     
     if ui_container:
         progress_bar.progress(0, text="병렬 AI 분석 시작...")
     
     results = {}
-    with ThreadPoolExecutor(max_workers=3) as executor:
+    with ThreadPoolExecutor(max_workers=5) as executor:
         futures = [executor.submit(process_single_group, i) for i in range(5)]
         
         for future in as_completed(futures):
@@ -1317,21 +1471,16 @@ def handle_hs_classification_cases(user_input, context, hs_manager, ui_container
     for idx, ans in enumerate(group_answers):
         head_prompt += f"[그룹{idx+1} 답변]\n{ans}\n\n"
     head_prompt += f"\n사용자: {user_input}\n"
-    head_response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=head_prompt
-    )
+    yield from stream_generate("gemini-2.5-flash", head_prompt)
     
     if ui_container:
         progress_bar.progress(1.0, text="분석 완료!")
         st.success("✅ **모든 AI 분석이 완료되었습니다**")
         st.info("📋 **패널을 접고 아래에서 최종 답변을 확인하세요**")
-    
-    return clean_text(head_response.text)
 
 
 def handle_overseas_hs(user_input, context, hs_manager, ui_container=None):
-    """해외 HS 분류 사례 처리 (그룹별 Gemini + Head Agent)"""
+    """해외 HS 분류 사례 처리 (그룹별 Gemini + Head Agent, 최종 답변 스트리밍)"""
     import streamlit as st
     from datetime import datetime
     
@@ -1364,25 +1513,25 @@ def handle_overseas_hs(user_input, context, hs_manager, ui_container=None):
         relevant = hs_manager.get_overseas_context_group(user_input, i)
         prompt = f"{overseas_context}\n\n관련 데이터 (해외 관세청, 그룹{i+1}):\n{relevant}\n\n사용자: {user_input}\n"
         
-        start_time = datetime.now()
-        response = client.models.generate_content(
+        start_time = datetime.now()  # 화면 표시용 시작 시각
+        start_counter = time.perf_counter()
+        response = generate_content_with_retry(
             model="gemini-2.5-flash",
             contents=prompt
         )
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
+        processing_time = time.perf_counter() - start_counter
         
         answer = clean_text(response.text)
         return i, answer, start_time, processing_time
     
-    # 5개 그룹 병렬 처리 (max_workers=3)
+    # 5개 그룹 병렬 처리 (max_workers=5, 그룹별 호출을 한 번에 동시 실행)
     from concurrent.futures import ThreadPoolExecutor, as_completed
     
     if ui_container:
         progress_bar.progress(0, text="병렬 AI 분석 시작...")
     
     results = {}
-    with ThreadPoolExecutor(max_workers=3) as executor:
+    with ThreadPoolExecutor(max_workers=5) as executor:
         futures = [executor.submit(process_single_group, i) for i in range(5)]
         
         for future in as_completed(futures):
@@ -1423,14 +1572,9 @@ def handle_overseas_hs(user_input, context, hs_manager, ui_container=None):
     for idx, ans in enumerate(group_answers):
         head_prompt += f"[그룹{idx+1} 답변]\n{ans}\n\n"
     head_prompt += f"\n사용자: {user_input}\n"
-    head_response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=head_prompt
-    )
+    yield from stream_generate("gemini-2.5-flash", head_prompt)
     
     if ui_container:
         progress_bar.progress(1.0, text="분석 완료!")
         st.success("✅ **모든 AI 분석이 완료되었습니다**")
-        st.info("📋 **패널을 접고 아래에서 최종 답변을 확인하세요**")
-    
-    return clean_text(head_response.text)
\ No newline at end of file
+        st.info("📋 **패널을 접고 아래에서 최종 답변을 확인하세요**")
\ No newline at end of file